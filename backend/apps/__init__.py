@@ -13,6 +13,7 @@ from sanic_ext import Extend
 from sanic.log import logger
 
 from apps.utils.db_utils import DB
+from apps.utils.feishu_oauth import FeishuOAuth
 from apps.utils.jwt_utils import JWTUtil
 from config.settings import Config
 
@@ -24,6 +25,8 @@ def configure_extensions(sanic_app):
     DB(sanic_app)
     # jwt
     JWTUtil.init_app(sanic_app)
+    # 飞书 OAuth 异步HTTP客户端
+    FeishuOAuth.init_app(sanic_app)
 
 def configure_blueprints(sanic_app):
     """注册蓝图 - 自动发现机制"""
@@ -3,11 +3,41 @@
 处理用户认证相关的业务逻辑
 支持: Linux.do OAuth + 飞书 OAuth + 本地用户名密码认证
 """
-import datetime
+from cachetools import TTLCache
 from sanic.log import logger
+from apps.utils.db_adapter import precompile_sql
 from apps.utils.password_utils import PasswordUtil
 
 
+# 用户查询列（不含敏感字段）；仅本地密码校验需要 password_hash
+USER_PUBLIC_COLS = (
+    "id, username, linux_do_id, linux_do_username, feishu_open_id, feishu_union_id, "
+    "name, avatar, email, auth_type, is_active, is_admin, last_login_time, create_time"
+)
+USER_AUTH_COLS = USER_PUBLIC_COLS + ", password_hash"
+
+# 热点查询SQL（模块加载时预编译）
+SQL_USER_BY_ID = f"SELECT {USER_PUBLIC_COLS} FROM users WHERE id = ?"
+SQL_USER_BY_LINUX_DO_ID = f"SELECT {USER_PUBLIC_COLS} FROM users WHERE linux_do_id = ?"
+SQL_USER_BY_FEISHU_OPEN_ID = f"SELECT {USER_PUBLIC_COLS} FROM users WHERE feishu_open_id = ?"
+SQL_USER_BY_USERNAME = f"SELECT {USER_PUBLIC_COLS} FROM users WHERE username = ?"
+SQL_LOCAL_USER_BY_USERNAME = f"SELECT {USER_AUTH_COLS} FROM users WHERE username = ? AND auth_type = 'local'"
+
+precompile_sql(
+    SQL_USER_BY_ID,
+    SQL_USER_BY_LINUX_DO_ID,
+    SQL_USER_BY_FEISHU_OPEN_ID,
+    SQL_USER_BY_USERNAME,
+    SQL_LOCAL_USER_BY_USERNAME,
+)
+
+# 用户信息进程内缓存: id -> 用户信息；外部ID -> id 的映射单独存放，按 id 失效即可
+# 缓存操作均为同步调用，在单个事件循环内无需加锁
+_user_cache = TTLCache(maxsize=10_000, ttl=30)
+_user_id_index = TTLCache(maxsize=20_000, ttl=30)
+_USER_INDEX_COLUMNS = ('linux_do_id', 'feishu_open_id')
+
+
 class AuthService:
     """认证服务类"""
     
@@ -20,6 +50,30 @@ class AuthService:
         """
         self.db = db
     
+    @staticmethod
+    def _get_cached_user(column, value):
+        """从缓存读取用户信息,未命中返回None"""
+        user_id = value if column == 'id' else _user_id_index.get((column, value))
+        if user_id is None:
+            return None
+        return _user_cache.get(user_id)
+    
+    @staticmethod
+    def _cache_user(user):
+        """写入用户缓存,返回原对象"""
+        if not user:
+            return user
+        _user_cache[user['id']] = user
+        for column in _USER_INDEX_COLUMNS:
+            if user.get(column):
+                _user_id_index[(column, user[column])] = user['id']
+        return user
+    
+    @staticmethod
+    def invalidate_user_cache(user_id):
+        """使指定用户的缓存失效"""
+        _user_cache.pop(user_id, None)
+    
     async def create_or_update_user_from_linux_do(self, user_info):
         """
         从Linux.do用户信息创建或更新用户
@@ -42,55 +96,32 @@ class AuthService:
             raise ValueError('用户信息中缺少id字段')
         
         try:
-            # 1. 查询用户是否存在
-            sql = "SELECT * FROM users WHERE linux_do_id = ?"
-            user = await self.db.get(sql, [linux_do_id])
-            
-            current_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
             # 处理头像URL (支持多种尺寸)
             avatar_template = user_info.get('avatar_template', '')
             avatar = avatar_template.replace('{size}', '240') if avatar_template and '{size}' in avatar_template else avatar_template
             
             # 确保 name 字段不为空：优先使用 name，其次 username，最后使用 linux_do_username
             name = user_info.get('name') or user_info.get('username') or user_info.get('linux_do_username', '未知用户')
-            linux_do_username = user_info.get('username', '')
             
-            if user:
-                # 2. 用户存在,更新用户信息和登录时间（使用参数化查询）
-                update_sql = """
-                    UPDATE users SET 
-                        name = ?,
-                        linux_do_username = ?,
-                        avatar = ?,
-                        auth_type = 'linux_do',
-                        last_login_time = ?
-                    WHERE linux_do_id = ?
-                """
-                
-                await self.db.execute(update_sql, [name, linux_do_username, avatar, current_time, linux_do_id])
-                
-                # 重新查询用户信息
-                sql = "SELECT * FROM users WHERE linux_do_id = ?"
-                return await self.db.get(sql, [linux_do_id])
-            else:
-                # 3. 用户不存在,创建新用户
-                # 确保 name 字段不为空：优先使用 name，其次 username，最后使用 linux_do_username
-                name = user_info.get('name') or user_info.get('username') or user_info.get('linux_do_username', '未知用户')
-                
-                fields = {
-                    'linux_do_id': linux_do_id,
-                    'linux_do_username': user_info.get('username', ''),
-                    'name': name,
-                    'avatar': avatar,
-                    'auth_type': 'linux_do',
-                    'is_active': 1 if user_info.get('active', True) else 0,
-                    'last_login_time': current_time
-                }
-                
-                user_id = await self.db.table_insert('users', fields)
-                
-                return await self.get_user_by_id(user_id)
+            fields = {
+                'linux_do_id': linux_do_id,
+                'linux_do_username': user_info.get('username', ''),
+                'name': name,
+                'avatar': avatar,
+                'auth_type': 'linux_do',
+                'is_active': 1 if user_info.get('active', True) else 0
+            }
+            
+            # 用户不存在则创建；已存在则更新用户信息和登录时间（不修改激活状态）
+            user = await self.db.upsert_returning(
+                'users',
+                'linux_do_id',
+                fields,
+                update_columns=['name', 'linux_do_username', 'avatar', 'auth_type', 'last_login_time'],
+                returning=USER_PUBLIC_COLS,
+                raw_values={'last_login_time': 'CURRENT_TIMESTAMP'}
+            )
+            return self._cache_user(user)
                 
         except Exception as e:
             logger.error(f'❌ 创建或更新Linux.do用户失败: {e}')
@@ -106,51 +137,31 @@ class AuthService:
             raise ValueError('用户信息中缺少open_id')
         
         try:
-            sql = "SELECT * FROM users WHERE feishu_open_id = ?"
-            user = await self.db.get(sql, [feishu_open_id])
-            
-            current_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             avatar = user_info.get('avatar_640') or user_info.get('avatar_240') or user_info.get('avatar_72') or ''
             name = user_info.get('name') or '飞书用户'
             email = user_info.get('email') or user_info.get('enterprise_email', '')
             feishu_union_id = user_info.get('union_id') or ''
             
-            if user:
-                update_sql = """
-                    UPDATE users SET
-                        name = ?,
-                        avatar = ?,
-                        email = ?,
-                        feishu_union_id = ?,
-                        auth_type = 'feishu',
-                        last_login_time = ?
-                    WHERE feishu_open_id = ?
-                """
-                await self.db.execute(update_sql, [
-                    name,
-                    avatar,
-                    email,
-                    feishu_union_id,
-                    current_time,
-                    feishu_open_id
-                ])
-                
-                sql = "SELECT * FROM users WHERE feishu_open_id = ?"
-                return await self.db.get(sql, [feishu_open_id])
-            else:
-                fields = {
-                    'feishu_open_id': feishu_open_id,
-                    'feishu_union_id': feishu_union_id,
-                    'name': name,
-                    'avatar': avatar,
-                    'email': email,
-                    'auth_type': 'feishu',
-                    'is_active': 1,
-                    'last_login_time': current_time
-                }
-                
-                user_id = await self.db.table_insert('users', fields)
-                return await self.get_user_by_id(user_id)
+            fields = {
+                'feishu_open_id': feishu_open_id,
+                'feishu_union_id': feishu_union_id,
+                'name': name,
+                'avatar': avatar,
+                'email': email,
+                'auth_type': 'feishu',
+                'is_active': 1
+            }
+            
+            # 用户不存在则创建；已存在则更新用户信息和登录时间（不修改激活状态）
+            user = await self.db.upsert_returning(
+                'users',
+                'feishu_open_id',
+                fields,
+                update_columns=['name', 'avatar', 'email', 'feishu_union_id', 'auth_type', 'last_login_time'],
+                returning=USER_PUBLIC_COLS,
+                raw_values={'last_login_time': 'CURRENT_TIMESTAMP'}
+            )
+            return self._cache_user(user)
         except Exception as e:
             logger.error(f'❌ 创建或更新飞书用户失败: {e}')
             raise
@@ -165,16 +176,13 @@ class AuthService:
         Returns:
             dict: 用户信息,不存在返回None
         """
-        try:
-            sql = "SELECT * FROM users WHERE id = ?"
-            user = await self.db.get(sql, [user_id])
-            
-            # 移除敏感字段
-            if user and 'password_hash' in user:
-                user = dict(user)
-                del user['password_hash']
-            
+        user = self._get_cached_user('id', user_id)
+        if user:
             return user
+        
+        try:
+            sql = SQL_USER_BY_ID
+            return self._cache_user(await self.db.get_row(sql, [user_id]))
             
         except Exception as e:
             logger.error(f'❌ 查询用户失败: {e}')
@@ -193,29 +201,26 @@ class AuthService:
             dict: 用户信息
         """
         try:
-            # 1. 检查用户名是否已存在
-            sql = "SELECT * FROM users WHERE username = ?"
-            existing_user = await self.db.get(sql, [username])
-            
-            if existing_user:
-                raise ValueError(f'用户名 {username} 已存在')
-            
-            # 2. 密码哈希
+            # 1. 密码哈希
             password_hash = PasswordUtil.hash_password(password)
             
-            # 3. 创建用户
+            # 2. 创建用户（用户名唯一键冲突时不插入）
             # 确保 name 字段不为空：如果未提供 name，使用 username 作为默认值
-            current_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             fields = {
                 'username': username,
                 'password_hash': password_hash,
                 'name': name if name else username,  # 默认使用 username
                 'auth_type': 'local',
-                'is_active': 1,
-                'last_login_time': current_time
+                'is_active': 1
             }
             
-            user_id = await self.db.table_insert('users', fields)
+            user_id = await self.db.table_insert_ignore(
+                'users',
+                fields,
+                raw_values={'last_login_time': 'CURRENT_TIMESTAMP'}
+            )
+            if not user_id:
+                raise ValueError(f'用户名 {username} 已存在')
             
             logger.info(f'✅ 本地用户创建成功: username={username}, id={user_id}')
             
@@ -238,8 +243,8 @@ class AuthService:
         """
         try:
             # 1. 查询用户
-            sql = "SELECT * FROM users WHERE username = ? AND auth_type = 'local'"
-            user = await self.db.get(sql, [username])
+            sql = SQL_LOCAL_USER_BY_USERNAME
+            user = await self.db.get_row(sql, [username])
             
             if not user:
                 logger.warning(f'⚠️  用户不存在: username={username}')
@@ -256,7 +261,15 @@ class AuthService:
                 logger.warning(f'⚠️  密码错误: username={username}')
                 return None
             
-            # 4. 更新最后登录时间
+            # 4. 旧的bcrypt哈希在登录成功后透明迁移为Argon2id
+            if PasswordUtil.needs_rehash(password_hash):
+                await self.db.execute(
+                    "UPDATE users SET password_hash = ? WHERE id = ?",
+                    [PasswordUtil.hash_password(password), user['id']]
+                )
+                logger.info(f'🔄 用户密码哈希已升级: username={username}')
+            
+            # 5. 更新最后登录时间
             await self.update_last_login_time(user['id'])
             
             logger.info(f'✅ 本地用户登录成功: username={username}, id={user["id"]}')
@@ -277,11 +290,15 @@ class AuthService:
         Returns:
             dict: 用户信息,不存在返回None
         """
+        user = self._get_cached_user('linux_do_id', linux_do_id)
+        if user:
+            return user
+        
         try:
-            sql = "SELECT * FROM users WHERE linux_do_id = ?"
-            user = await self.db.get(sql, [linux_do_id])
+            sql = SQL_USER_BY_LINUX_DO_ID
+            user = await self.db.get_row(sql, [linux_do_id])
             
-            return user
+            return self._cache_user(user)
             
         except Exception as e:
             logger.error(f'❌ 查询用户失败: {e}')
@@ -298,8 +315,8 @@ class AuthService:
             dict: 用户信息,不存在返回None
         """
         try:
-            sql = "SELECT * FROM users WHERE username = ?"
-            user = await self.db.get(sql, [username])
+            sql = SQL_USER_BY_USERNAME
+            user = await self.db.get_row(sql, [username])
             
             return user
             
@@ -311,9 +328,13 @@ class AuthService:
         """
         根据飞书open_id获取用户
         """
+        user = self._get_cached_user('feishu_open_id', feishu_open_id)
+        if user:
+            return user
+        
         try:
-            sql = "SELECT * FROM users WHERE feishu_open_id = ?"
-            return await self.db.get(sql, [feishu_open_id])
+            sql = SQL_USER_BY_FEISHU_OPEN_ID
+            return self._cache_user(await self.db.get_row(sql, [feishu_open_id]))
         except Exception as e:
             logger.error(f'❌ 查询飞书用户失败: {e}')
             raise
@@ -325,10 +346,18 @@ class AuthService:
         Args:
             user_id: 用户ID
         """
+        self.invalidate_user_cache(user_id)
+        
+        # 优先写入内存缓冲，由后台任务批量写回
+        login_buffer = getattr(self.db, 'login_buffer', None)
+        if login_buffer is not None:
+            login_buffer.add_flush_listener(self.invalidate_user_cache)
+            login_buffer.record(user_id)
+            return
+        
         try:
-            current_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            sql = f"UPDATE users SET last_login_time = '{current_time}' WHERE id = {user_id}"
-            await self.db.execute(sql)
+            sql = "UPDATE users SET last_login_time = CURRENT_TIMESTAMP WHERE id = ?"
+            await self.db.execute(sql, [user_id])
             
         except Exception as e:
             logger.error(f'❌ 更新登录时间失败: {e}')
@@ -342,8 +371,9 @@ class AuthService:
             user_id: 用户ID
         """
         try:
-            sql = f"UPDATE users SET is_active = 0 WHERE id = {user_id}"
-            await self.db.execute(sql)
+            sql = "UPDATE users SET is_active = 0 WHERE id = ?"
+            await self.db.execute(sql, [user_id])
+            self.invalidate_user_cache(user_id)
             
         except Exception as e:
             logger.error(f'❌ 禁用用户失败: {e}')
@@ -357,8 +387,9 @@ class AuthService:
             user_id: 用户ID
         """
         try:
-            sql = f"UPDATE users SET is_active = 1 WHERE id = {user_id}"
-            await self.db.execute(sql)
+            sql = "UPDATE users SET is_active = 1 WHERE id = ?"
+            await self.db.execute(sql, [user_id])
+            self.invalidate_user_cache(user_id)
             
         except Exception as e:
             logger.error(f'❌ 激活用户失败: {e}')
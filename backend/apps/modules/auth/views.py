@@ -165,7 +165,7 @@ async def feishu_login(request):
         
         try:
             oauth = FeishuOAuth()
-            user_info = oauth.get_user_by_code(code)
+            user_info = await oauth.get_user_by_code(code)
         except Exception as e:
             logger.error(f'❌ 获取飞书用户信息失败: {e}')
             return json({
@@ -66,14 +66,18 @@ class CommunityService:
             for row in rows:
                 item = self._serialize_row(row)
                 item['is_liked'] = False
-                
-                if current_user_id:
-                    like_sql = 'SELECT id FROM prompt_likes WHERE prompt_id = ? AND user_id = ?'
-                    like_row = await self.db.get(like_sql, [row['id'], current_user_id])
-                    item['is_liked'] = bool(like_row)
-                
                 items.append(item)
             
+            if current_user_id and rows:
+                # 一次查询取出当前页中已点赞的提示词
+                prompt_ids = [row['id'] for row in rows]
+                placeholders = ', '.join('?' for _ in prompt_ids)
+                like_sql = f'SELECT prompt_id FROM prompt_likes WHERE user_id = ? AND prompt_id IN ({placeholders})'
+                like_rows = await self.db.query(like_sql, [current_user_id] + prompt_ids)
+                liked_ids = {like_row['prompt_id'] for like_row in like_rows}
+                for item in items:
+                    item['is_liked'] = item['id'] in liked_ids
+            
             return {
                 'total': total,
                 'page': page,
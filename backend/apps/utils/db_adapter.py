@@ -5,18 +5,87 @@
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import os
+import time
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
 from urllib.parse import quote_plus
 
+import aiosqlite
 from sanic.log import logger
-from sqlalchemy import text
-from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy import RowMapping, text
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+
+from apps.utils.login_buffer import LastLoginBuffer
+from apps.utils.password_utils import PasswordUtil
 
 
 SqlParams = Union[Sequence[Any], Dict[str, Any], None]
 
+# 上次成功同步时的管理员配置指纹，配置与账号均未变化时启动可跳过同步
+ADMIN_CONFIG_META_KEY = 'admin_config_fingerprint'
+
+SYSTEM_METADATA_DDL = """
+    CREATE TABLE IF NOT EXISTS system_metadata (
+      meta_key VARCHAR(64) NOT NULL PRIMARY KEY,
+      meta_value VARCHAR(255) DEFAULT NULL,
+      updated_at BIGINT NOT NULL DEFAULT 0
+    )
+"""
+
+# 用户表查询列索引: (索引名, 列名, 是否唯一)，用于老库补建索引
+USER_LOOKUP_INDEXES: Tuple[Tuple[str, str, bool], ...] = (
+    ('uk_linux_do_id', 'linux_do_id', True),
+    ('uk_feishu_open_id', 'feishu_open_id', True),
+    ('uk_username', 'username', True),
+    ('idx_email', 'email', False),
+)
+
+
+@lru_cache(maxsize=512)
+def _text_clause(sql: str) -> TextClause:
+    """按原始SQL缓存 text() 对象"""
+    return text(sql)
+
+
+@lru_cache(maxsize=512)
+def _compile_sql(sql: str) -> Tuple[TextClause, Tuple[str, ...]]:
+    """将 ? 占位符转换为 :pN 命名参数，按原始SQL缓存转换结果"""
+    parts = sql.split('?')
+    keys = tuple(f"p{idx}" for idx in range(len(parts) - 1))
+    builder = [parts[0]]
+    for key, part in zip(keys, parts[1:]):
+        builder.append(f":{key}")
+        builder.append(part)
+    return text(''.join(builder)), keys
+
+
+class RequestConnectionScope:
+    """
+    请求级连接作用域：请求内首次访问数据库时获取连接，请求结束时释放
+    同一请求内的并发查询在该连接上排队执行，不会再从连接池额外获取连接
+    """
+
+    def __init__(self):
+        self.conn: Optional[AsyncConnection] = None
+        self.lock = asyncio.Lock()
+        self.token = None
+
+
+_request_scope: ContextVar[Optional[RequestConnectionScope]] = ContextVar('db_request_scope', default=None)
+
+
+def precompile_sql(*statements: str):
+    """预编译热点SQL，避免首次请求时再做占位符转换"""
+    for statement in statements:
+        _compile_sql(statement)
+
 
 class DatabaseAdapter(ABC):
     """数据库适配器基类"""
@@ -37,14 +106,47 @@ class DatabaseAdapter(ABC):
     async def query(self, sql: str, params: SqlParams = None) -> List[Dict[str, Any]]:
         """查询多条记录"""
 
+    @abstractmethod
+    async def get_row(self, sql: str, params: SqlParams = None) -> Optional[Mapping[str, Any]]:
+        """查询单条记录（只读映射，不复制为dict）"""
+
+    @abstractmethod
+    async def query_rows(self, sql: str, params: SqlParams = None) -> List[Mapping[str, Any]]:
+        """查询多条记录（只读映射，不复制为dict）"""
+
     @abstractmethod
     async def execute(self, sql: str, params: SqlParams = None) -> int:
         """执行SQL，返回影响行数"""
 
+    @abstractmethod
+    async def execute_many(self, sql: str, rows: Sequence[SqlParams]) -> int:
+        """使用同一条SQL批量执行多组参数，返回影响行数"""
+
     @abstractmethod
     async def table_insert(self, table: str, data: Dict[str, Any]) -> int:
         """插入数据并返回自增ID"""
 
+    @abstractmethod
+    async def table_insert_ignore(
+        self,
+        table: str,
+        data: Dict[str, Any],
+        raw_values: Optional[Dict[str, str]] = None,
+    ) -> int:
+        """插入数据，唯一键冲突时忽略并返回0；raw_values 为直接写入SQL的列表达式"""
+
+    @abstractmethod
+    async def upsert_returning(
+        self,
+        table: str,
+        conflict_col: str,
+        data: Dict[str, Any],
+        update_columns: Optional[Sequence[str]] = None,
+        returning: str = '*',
+        raw_values: Optional[Dict[str, str]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """插入或更新数据，并返回最终记录；raw_values 为直接写入SQL的列表达式"""
+
     @abstractmethod
     async def table_update(self, table: str, data: Dict[str, Any], where: str):
         """更新数据"""
@@ -57,40 +159,120 @@ class DatabaseAdapter(ABC):
 class SQLAlchemyAdapter(DatabaseAdapter):
     """基于 SQLAlchemy AsyncEngine 的通用适配器"""
 
-    def __init__(self, db_url: str, *, connect_args: Optional[Dict[str, Any]] = None):
+    def __init__(
+        self,
+        db_url: str,
+        *,
+        connect_args: Optional[Dict[str, Any]] = None,
+        pool_size: int = 20,
+        max_overflow: int = 30,
+        pool_recycle: int = 1800,
+        pool_timeout: int = 30,
+        pool_use_lifo: bool = True,
+    ):
         self.db_url = db_url
-        self.engine: AsyncEngine = create_async_engine(
-            db_url,
-            echo=False,
-            pool_pre_ping=True,
-            future=True,
-            connect_args=connect_args or {},
-        )
+        self.login_buffer: Optional[LastLoginBuffer] = None
+        engine_options: Dict[str, Any] = {
+            'echo': False,
+            'pool_pre_ping': True,
+            'future': True,
+            # 编译语句缓存，避免热路径上重复编译相同的 text() 语句
+            'query_cache_size': 1200,
+            'connect_args': connect_args or {},
+        }
+        if not db_url.startswith('sqlite'):
+            # SQLite 使用驱动默认连接池，仅网络数据库需要调优连接池参数
+            engine_options.update(
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+                pool_recycle=pool_recycle,
+                pool_timeout=pool_timeout,
+                pool_use_lifo=pool_use_lifo,
+            )
+        self.engine: AsyncEngine = create_async_engine(db_url, **engine_options)
 
     async def connect(self):
         async with self.engine.connect() as conn:
-            await conn.execute(text('SELECT 1'))
+            await conn.execute(_text_clause('SELECT 1'))
+
+    async def acquire_scoped(self) -> AsyncConnection:
+        """获取一个自动提交的连接，供整个请求复用"""
+        conn = await self.engine.connect()
+        return await conn.execution_options(isolation_level='AUTOCOMMIT')
+
+    def begin_request_scope(self) -> RequestConnectionScope:
+        scope = RequestConnectionScope()
+        scope.token = _request_scope.set(scope)
+        return scope
+
+    async def end_request_scope(self, scope: RequestConnectionScope):
+        try:
+            _request_scope.reset(scope.token)
+        except ValueError:
+            pass
+        async with scope.lock:
+            if scope.conn is not None:
+                conn, scope.conn = scope.conn, None
+                await conn.close()
+
+    @asynccontextmanager
+    async def _connection(self, write: bool = False):
+        """
+        优先复用请求级连接；无作用域时从连接池获取
+        持有请求级连接时不再嵌套获取第二个连接，否则并发请求数达到连接池上限时会互相等待而死锁
+        """
+        scope = _request_scope.get()
+        if scope is None:
+            context = self.engine.begin() if write else self.engine.connect()
+            async with context as conn:
+                yield conn
+            return
+        async with scope.lock:
+            if scope.conn is None:
+                scope.conn = await self.acquire_scoped()
+            yield scope.conn
 
     async def close(self):
+        if self.login_buffer is not None:
+            await self.login_buffer.stop()
         await self.engine.dispose()
 
     async def get(self, sql: str, params: SqlParams = None) -> Optional[Dict[str, Any]]:
-        sql_text, bind_params = self._prepare_sql(sql, params)
-        async with self.engine.connect() as conn:
-            result = await conn.execute(text(sql_text), bind_params)
-            row = result.mappings().first()
-            return dict(row) if row else None
+        row = await self.get_row(sql, params)
+        return dict(row) if row else None
 
     async def query(self, sql: str, params: SqlParams = None) -> List[Dict[str, Any]]:
-        sql_text, bind_params = self._prepare_sql(sql, params)
-        async with self.engine.connect() as conn:
-            result = await conn.execute(text(sql_text), bind_params)
-            return [dict(row) for row in result.mappings().all()]
+        return [dict(row) for row in await self.query_rows(sql, params)]
+
+    async def get_row(self, sql: str, params: SqlParams = None) -> Optional[RowMapping]:
+        statement, bind_params = self._prepare_sql(sql, params)
+        async with self._connection() as conn:
+            result = await conn.execute(statement, bind_params)
+            return result.mappings().first()
+
+    async def query_rows(self, sql: str, params: SqlParams = None) -> List[RowMapping]:
+        statement, bind_params = self._prepare_sql(sql, params)
+        async with self._connection() as conn:
+            result = await conn.execute(statement, bind_params)
+            return list(result.mappings().all())
 
     async def execute(self, sql: str, params: SqlParams = None) -> int:
-        sql_text, bind_params = self._prepare_sql(sql, params)
-        async with self.engine.begin() as conn:
-            result = await conn.execute(text(sql_text), bind_params)
+        statement, bind_params = self._prepare_sql(sql, params)
+        async with self._connection(write=True) as conn:
+            result = await conn.execute(statement, bind_params)
+            return result.rowcount if result.rowcount is not None else 0
+
+    async def execute_many(self, sql: str, rows: Sequence[SqlParams]) -> int:
+        if not rows:
+            return 0
+        statement = None
+        bind_rows: List[Dict[str, Any]] = []
+        for row in rows:
+            statement, bind_params = self._prepare_sql(sql, row)
+            bind_rows.append(bind_params)
+        # 传入参数列表时 SQLAlchemy 走驱动的 executemany
+        async with self._connection(write=True) as conn:
+            result = await conn.execute(statement, bind_rows)
             return result.rowcount if result.rowcount is not None else 0
 
     async def table_insert(self, table: str, data: Dict[str, Any]) -> int:
@@ -99,12 +281,81 @@ class SQLAlchemyAdapter(DatabaseAdapter):
         columns = ', '.join(data.keys())
         placeholders = ', '.join(['?'] * len(data))
         sql = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
-        sql_text, bind_params = self._prepare_sql(sql, list(data.values()))
-        async with self.engine.begin() as conn:
-            result = await conn.execute(text(sql_text), bind_params)
+        statement, bind_params = self._prepare_sql(sql, list(data.values()))
+        async with self._connection(write=True) as conn:
+            result = await conn.execute(statement, bind_params)
             last_id = result.lastrowid
             return int(last_id) if last_id is not None else 0
 
+    async def table_insert_ignore(
+        self,
+        table: str,
+        data: Dict[str, Any],
+        raw_values: Optional[Dict[str, str]] = None,
+    ) -> int:
+        if not data:
+            raise ValueError('table_insert_ignore 需要有效的数据字典')
+        columns, placeholders = self._insert_clauses(data, raw_values)
+        if self.engine.dialect.name == 'mysql':
+            # 不使用 INSERT IGNORE：它会把截断、非空约束等错误一并降级为警告；
+            # 空操作的 ON DUPLICATE KEY UPDATE 只吞掉唯一键冲突，冲突时 lastrowid 为0
+            first_column = next(iter(data))
+            sql = (
+                f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) "
+                f"ON DUPLICATE KEY UPDATE {first_column} = {first_column}"
+            )
+        else:
+            sql = f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) ON CONFLICT DO NOTHING"
+        statement, bind_params = self._prepare_sql(sql, list(data.values()))
+        async with self._connection(write=True) as conn:
+            result = await conn.execute(statement, bind_params)
+            if not result.rowcount:
+                return 0
+            last_id = result.lastrowid
+            return int(last_id) if last_id else 0
+
+    async def upsert_returning(
+        self,
+        table: str,
+        conflict_col: str,
+        data: Dict[str, Any],
+        update_columns: Optional[Sequence[str]] = None,
+        returning: str = '*',
+        raw_values: Optional[Dict[str, str]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        if not data or conflict_col not in data:
+            raise ValueError('upsert_returning 需要包含冲突列的数据字典')
+        if update_columns is None:
+            update_columns = [column for column in [*data.keys(), *(raw_values or {})] if column != conflict_col]
+        if not update_columns:
+            raise ValueError('upsert_returning 需要至少一个更新列')
+        columns, placeholders = self._insert_clauses(data, raw_values)
+        insert_sql = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+        dialect = self.engine.dialect.name
+
+        if dialect == 'sqlite':
+            # SQLite 3.35+ 支持 RETURNING，一次往返完成插入/更新并取回记录
+            set_clause = ', '.join([f"{column} = excluded.{column}" for column in update_columns])
+            sql = f"{insert_sql} ON CONFLICT({conflict_col}) DO UPDATE SET {set_clause} RETURNING {returning}"
+            statement, bind_params = self._prepare_sql(sql, list(data.values()))
+            async with self._connection(write=True) as conn:
+                result = await conn.execute(statement, bind_params)
+                row = result.mappings().first()
+                return dict(row) if row else None
+
+        if dialect == 'mysql':
+            # MySQL 不支持 INSERT ... RETURNING，在同一连接内 upsert 后回查
+            set_clause = ', '.join([f"{column} = VALUES({column})" for column in update_columns])
+            sql = f"{insert_sql} ON DUPLICATE KEY UPDATE {set_clause}"
+            select_sql = f"SELECT {returning} FROM {table} WHERE {conflict_col} = ?"
+            async with self._connection(write=True) as conn:
+                await conn.execute(*self._prepare_sql(sql, list(data.values())))
+                result = await conn.execute(*self._prepare_sql(select_sql, [data[conflict_col]]))
+                row = result.mappings().first()
+                return dict(row) if row else None
+
+        raise ValueError(f"不支持的数据库方言: {dialect}")
+
     async def table_update(self, table: str, data: Dict[str, Any], where: str):
         if not data:
             return
@@ -117,30 +368,28 @@ class SQLAlchemyAdapter(DatabaseAdapter):
         return self.engine.begin()
 
     @staticmethod
-    def _prepare_sql(sql: str, params: SqlParams) -> Tuple[str, Dict[str, Any]]:
+    def _insert_clauses(data: Dict[str, Any], raw_values: Optional[Dict[str, str]] = None) -> Tuple[str, str]:
+        """生成 INSERT 的列清单与值清单，raw_values 中的表达式原样写入SQL"""
+        raw_values = raw_values or {}
+        columns = ', '.join([*data.keys(), *raw_values.keys()])
+        placeholders = ', '.join(['?'] * len(data) + list(raw_values.values()))
+        return columns, placeholders
+
+    @staticmethod
+    def _prepare_sql(sql: str, params: SqlParams) -> Tuple[TextClause, Dict[str, Any]]:
         if params is None:
-            return sql, {}
+            return _text_clause(sql), {}
         if isinstance(params, dict):
-            return sql, params
+            return _text_clause(sql), params
         values = list(params)
         if not values:
-            return sql, {}
-        builder: List[str] = []
-        bind: Dict[str, Any] = {}
-        idx = 0
-        for ch in sql:
-            if ch == '?':
-                key = f"p{idx}"
-                if idx >= len(values):
-                    raise ValueError('SQL参数个数不足')
-                builder.append(f":{key}")
-                bind[key] = values[idx]
-                idx += 1
-            else:
-                builder.append(ch)
-        if idx != len(values):
+            return _text_clause(sql), {}
+        statement, keys = _compile_sql(sql)
+        if len(keys) < len(values):
             raise ValueError('SQL参数个数过多')
-        return ''.join(builder), bind
+        if len(keys) > len(values):
+            raise ValueError('SQL参数个数不足')
+        return statement, dict(zip(keys, values))
 
 
 class SQLiteAdapter(SQLAlchemyAdapter):
@@ -149,7 +398,10 @@ class SQLiteAdapter(SQLAlchemyAdapter):
         db_dir = os.path.dirname(self.db_path)
         if db_dir and not os.path.exists(db_dir):
             os.makedirs(db_dir, exist_ok=True)
-        super().__init__(f"sqlite+aiosqlite:///{self.db_path}")
+        super().__init__(
+            f"sqlite+aiosqlite:///{self.db_path}",
+            connect_args={'check_same_thread': False},
+        )
 
 
 class MySQLAdapter(SQLAlchemyAdapter):
@@ -160,7 +412,13 @@ class MySQLAdapter(SQLAlchemyAdapter):
         host = config.get('host', 'localhost')
         port = config.get('port', 3306)
         db_url = f"mysql+aiomysql://{user}:{password}@{host}:{port}/{self.db_name}"
-        super().__init__(db_url)
+        super().__init__(
+            db_url,
+            pool_size=config.get('pool_size', 20),
+            max_overflow=config.get('max_overflow', 30),
+            pool_recycle=config.get('pool_recycle', 1800),
+            pool_timeout=config.get('pool_timeout', 30),
+        )
 
 
 async def create_database_adapter(db_type: str, config: Dict[str, Any], app_config: Dict[str, Any] = None) -> DatabaseAdapter:
@@ -168,15 +426,22 @@ async def create_database_adapter(db_type: str, config: Dict[str, Any], app_conf
         adapter = SQLiteAdapter(config['path'])
         await adapter.connect()
         await _initialize_sqlite_if_needed(adapter, app_config)
+        _start_login_buffer(adapter)
         return adapter
     if db_type == 'mysql':
         adapter = MySQLAdapter(config)
         await adapter.connect()
         await _initialize_mysql_if_needed(adapter, config, app_config)
+        _start_login_buffer(adapter)
         return adapter
     raise ValueError(f"不支持的数据库类型: {db_type}")
 
 
+def _start_login_buffer(adapter: SQLAlchemyAdapter):
+    adapter.login_buffer = LastLoginBuffer(adapter)
+    adapter.login_buffer.start()
+
+
 async def _initialize_sqlite_if_needed(adapter: SQLiteAdapter, config: Dict[str, Any] = None):
     try:
         result = await adapter.get(
@@ -191,8 +456,6 @@ async def _initialize_sqlite_if_needed(adapter: SQLiteAdapter, config: Dict[str,
             )
 
             if os.path.exists(script_path):
-                import aiosqlite
-
                 async with aiosqlite.connect(adapter.db_path) as db:
                     with open(script_path, 'r', encoding='utf-8') as f:
                         await db.executescript(f.read())
@@ -203,7 +466,8 @@ async def _initialize_sqlite_if_needed(adapter: SQLiteAdapter, config: Dict[str,
                 logger.warning(f"⚠️  未找到SQLite初始化脚本: {script_path}")
         else:
             logger.info('✅ SQLite数据库已存在，跳过表结构初始化')
-            await _sync_admin_account(adapter, config)
+            await _ensure_sqlite_user_indexes(adapter)
+            await _sync_admin_account_if_changed(adapter, config)
     except Exception as exc:
         logger.error(f'❌ SQLite数据库初始化检查失败: {exc}')
         raise
@@ -229,12 +493,116 @@ async def _initialize_mysql_if_needed(adapter: MySQLAdapter, db_config: Dict[str
             await _create_default_admin(adapter, app_config)
         else:
             logger.info('✅ MySQL数据库已存在，跳过表结构初始化')
-            await _sync_admin_account(adapter, app_config)
+            await _ensure_mysql_user_indexes(adapter, db_name)
+            await _sync_admin_account_if_changed(adapter, app_config)
     except Exception as exc:
         logger.exception(f'❌ MySQL数据库初始化检查失败: {exc}')
         raise
 
 
+async def _sync_admin_account_if_changed(adapter: SQLAlchemyAdapter, config: Dict[str, Any] = None):
+    """
+    仅在管理员账号与上次同步时不一致、或配置的密码与库中哈希不匹配时执行同步：
+    配置未变化时启动只做一次密码校验，而配置变更后的首次启动一定会同步
+    """
+    try:
+        await adapter.execute(SYSTEM_METADATA_DDL)
+        fingerprint, password_hash = await _admin_config_fingerprint(adapter, config)
+        row = await adapter.get(
+            "SELECT meta_value FROM system_metadata WHERE meta_key = ?",
+            [ADMIN_CONFIG_META_KEY]
+        )
+    except Exception as exc:
+        # 读取同步记录失败时退化为直接同步
+        logger.warning(f'⚠️  读取管理员同步记录失败，将直接同步: {exc}')
+        await _sync_admin_account(adapter, config)
+        return
+
+    # 指纹不含明文密码，配置的密码是否变化通过校验库中的Argon2哈希判断
+    _, admin_password, _ = _admin_settings(config)
+    if (
+        row and row.get('meta_value') == fingerprint
+        and PasswordUtil.verify_password(admin_password, password_hash)
+        and not PasswordUtil.needs_rehash(password_hash)
+    ):
+        logger.info('⏭️  管理员账号配置未变化，跳过同步')
+        return
+
+    await _sync_admin_account(adapter, config)
+    # 同步可能更新了密码哈希，按同步后的账号状态记录指纹
+    fingerprint, _ = await _admin_config_fingerprint(adapter, config)
+    if adapter.engine.dialect.name == 'mysql':
+        upsert_sql = """
+            INSERT INTO system_metadata (meta_key, meta_value, updated_at) VALUES (?, ?, ?)
+            ON DUPLICATE KEY UPDATE meta_value = VALUES(meta_value), updated_at = VALUES(updated_at)
+        """
+    else:
+        upsert_sql = """
+            INSERT INTO system_metadata (meta_key, meta_value, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(meta_key) DO UPDATE SET meta_value = excluded.meta_value, updated_at = excluded.updated_at
+        """
+    await adapter.execute(upsert_sql, [ADMIN_CONFIG_META_KEY, fingerprint, int(time.time())])
+
+
+def _admin_settings(config: Dict[str, Any] = None) -> Tuple[str, str, str]:
+    """读取管理员账号配置: (用户名, 密码, 显示名)"""
+    config = config or {}
+    return (
+        config.get('DEFAULT_ADMIN_USERNAME', 'admin'),
+        config.get('DEFAULT_ADMIN_PASSWORD', 'admin123'),
+        config.get('DEFAULT_ADMIN_NAME', '管理员'),
+    )
+
+
+async def _admin_config_fingerprint(adapter: DatabaseAdapter, config: Dict[str, Any] = None) -> Tuple[str, str]:
+    """
+    管理员账号指纹：覆盖配置中的用户名、显示名以及库中当前的密码哈希，
+    任一变化（含在库中直接修改密码）都会触发重新同步。
+    不包含明文密码，避免库中留下可离线快速爆破的密码摘要
+    Returns:
+        (指纹, 库中当前的密码哈希)
+    """
+    admin_username, _, admin_name = _admin_settings(config)
+    row = await adapter.get(
+        "SELECT password_hash FROM users WHERE username = ? AND auth_type = 'local'",
+        [admin_username]
+    )
+    password_hash = (row or {}).get('password_hash') or ''
+    message = '\0'.join([admin_username, admin_name, password_hash]).encode('utf-8')
+    return hashlib.sha256(message).hexdigest(), password_hash
+
+
+async def _ensure_sqlite_user_indexes(adapter: DatabaseAdapter):
+    """为已有SQLite库补建用户查询索引（幂等）"""
+    for index_name, column, unique in USER_LOOKUP_INDEXES:
+        index_type = 'UNIQUE INDEX' if unique else 'INDEX'
+        try:
+            await adapter.execute(f"CREATE {index_type} IF NOT EXISTS {index_name} ON users({column})")
+        except Exception as exc:
+            logger.warning(f'⚠️  创建索引 {index_name} 失败: {exc}')
+
+
+async def _ensure_mysql_user_indexes(adapter: DatabaseAdapter, db_name: str):
+    """为已有MySQL库补建用户查询索引（MySQL不支持 CREATE INDEX IF NOT EXISTS，先查询再创建）"""
+    rows = await adapter.query(
+        """
+        SELECT DISTINCT index_name FROM information_schema.statistics
+        WHERE table_schema = ? AND table_name = 'users'
+        """,
+        [db_name]
+    )
+    existing = {(row.get('index_name') or row.get('INDEX_NAME')) for row in rows}
+    for index_name, column, unique in USER_LOOKUP_INDEXES:
+        if index_name in existing:
+            continue
+        index_type = 'UNIQUE INDEX' if unique else 'INDEX'
+        try:
+            await adapter.execute(f"CREATE {index_type} `{index_name}` ON `users` (`{column}`)")
+            logger.info(f'✅ 已创建索引: {index_name}')
+        except Exception as exc:
+            logger.warning(f'⚠️  创建索引 {index_name} 失败: {exc}')
+
+
 async def _execute_mysql_init_script(adapter: DatabaseAdapter):
     script_path = os.path.join(
         os.path.dirname(__file__),
@@ -250,41 +618,96 @@ async def _execute_mysql_init_script(adapter: DatabaseAdapter):
 
     statements = _split_sql_statements(sql_script)
 
-    for statement in statements:
-        try:
-            await adapter.execute(statement)
-        except Exception as exc:
-            logger.error(f'❌ 执行MySQL初始化语句失败: {exc} | SQL: {statement}')
-            raise
+    # 所有语句复用同一连接执行，避免每条语句单独获取连接和开启事务
+    async with adapter.transaction() as conn:
+        for statement in statements:
+            try:
+                await conn.execute(text(statement))
+            except Exception as exc:
+                logger.error(f'❌ 执行MySQL初始化语句失败: {exc} | SQL: {statement}')
+                raise
 
     logger.info('✅ MySQL表结构初始化完成')
 
 
 def _split_sql_statements(sql_script: str) -> List[str]:
-    statements: List[str] = []
-    buffer: List[str] = []
+    return list(_iter_sql_statements(sql_script))
+
+
+def _iter_sql_statements(sql_script: str) -> Iterator[str]:
+    """单次扫描拆分SQL脚本：跳过注释，识别引号内的分号与 DELIMITER 指令"""
+    delimiter = ';'
+    length = len(sql_script)
+    parts: List[str] = []
+    start = 0
+    i = 0
+
+    while i < length:
+        ch = sql_script[i]
+
+        if ch in ('\'', '"', '`'):
+            i = _skip_quoted(sql_script, i, ch)
+            continue
+
+        if ch == '#' or sql_script.startswith('--', i):
+            parts.append(sql_script[start:i])
+            end = sql_script.find('\n', i)
+            i = length if end == -1 else end
+            start = i
+            continue
 
-    for line in sql_script.splitlines():
-        stripped = line.strip()
-        if not stripped or stripped.startswith('--'):
+        # /*! ... */ 为MySQL可执行注释，保留原样
+        if sql_script.startswith('/*', i) and not sql_script.startswith('/*!', i):
+            parts.append(sql_script[start:i])
+            end = sql_script.find('*/', i + 2)
+            i = length if end == -1 else end + 2
+            start = i
             continue
-        buffer.append(line)
-        if stripped.endswith(';'):
-            statement = '\n'.join(buffer).strip()
-            if statement.endswith(';'):
-                statement = statement[:-1]
+
+        if sql_script.startswith(delimiter, i):
+            parts.append(sql_script[start:i])
+            statement = ''.join(parts).strip()
             if statement:
-                statements.append(statement)
-            buffer = []
+                yield statement
+            parts = []
+            i += len(delimiter)
+            start = i
+            continue
+
+        if (ch in 'Dd' and sql_script[i:i + 10].upper() == 'DELIMITER '
+                and not sql_script[start:i].strip() and not ''.join(parts).strip()):
+            end = sql_script.find('\n', i)
+            end = length if end == -1 else end
+            delimiter = sql_script[i + 10:end].strip() or ';'
+            parts = []
+            i = end
+            start = i
+            continue
 
-    if buffer:
-        statement = '\n'.join(buffer).strip()
-        if statement.endswith(';'):
-            statement = statement[:-1]
-        if statement:
-            statements.append(statement)
+        i += 1
 
-    return statements
+    parts.append(sql_script[start:])
+    statement = ''.join(parts).strip()
+    if statement:
+        yield statement
+
+
+def _skip_quoted(sql_script: str, start: int, quote: str) -> int:
+    """返回引号结束后的位置，支持反斜杠转义与连续两个引号的转义"""
+    length = len(sql_script)
+    i = start + 1
+    while i < length:
+        ch = sql_script[i]
+        if ch == '\\' and quote != '`':
+            i += 2
+            continue
+        if ch == quote:
+            if i + 1 < length and sql_script[i + 1] == quote:
+                i += 2
+                continue
+            return i + 1
+        i += 1
+    return length
 
 
 async def _create_default_admin(adapter: DatabaseAdapter, config: Dict[str, Any] = None):
@@ -307,11 +730,7 @@ async def _create_default_admin(adapter: DatabaseAdapter, config: Dict[str, Any]
             logger.info(f"✅ 管理员账号已存在: {admin_username}")
             return
 
-        import bcrypt
-
-        password_bytes = admin_password.encode('utf-8')
-        salt = bcrypt.gensalt(rounds=12)
-        password_hash = bcrypt.hashpw(password_bytes, salt).decode('utf-8')
+        password_hash = PasswordUtil.hash_password(admin_password)
 
         await adapter.execute(
             """
@@ -328,20 +747,7 @@ async def _create_default_admin(adapter: DatabaseAdapter, config: Dict[str, Any]
 
 async def _sync_admin_account(adapter: DatabaseAdapter, config: Dict[str, Any] = None):
     try:
-        admin_username = 'admin'
-        admin_password = 'admin123'
-        admin_name = '管理员'
-
-        if config:
-            admin_username = config.get('DEFAULT_ADMIN_USERNAME', 'admin')
-            admin_password = config.get('DEFAULT_ADMIN_PASSWORD', 'admin123')
-            admin_name = config.get('DEFAULT_ADMIN_NAME', '管理员')
-
-        import bcrypt
-
-        password_bytes = admin_password.encode('utf-8')
-        salt = bcrypt.gensalt(rounds=12)
-        password_hash = bcrypt.hashpw(password_bytes, salt).decode('utf-8')
+        admin_username, admin_password, admin_name = _admin_settings(config)
 
         existing_admin = await adapter.get(
             "SELECT id, password_hash FROM users WHERE username = ? AND auth_type = 'local'",
@@ -350,12 +756,11 @@ async def _sync_admin_account(adapter: DatabaseAdapter, config: Dict[str, Any] =
 
         if existing_admin:
             old_hash = existing_admin.get('password_hash', '') or ''
-            try:
-                is_password_correct = bcrypt.checkpw(password_bytes, old_hash.encode('utf-8'))
-            except Exception:
-                is_password_correct = False
+            is_password_correct = PasswordUtil.verify_password(admin_password, old_hash)
 
-            if not is_password_correct:
+            if not is_password_correct or PasswordUtil.needs_rehash(old_hash):
+                # 仅在密码不一致或哈希算法需要升级时才重新计算哈希
+                password_hash = PasswordUtil.hash_password(admin_password)
                 await adapter.execute(
                     "UPDATE users SET password_hash = ?, name = ? WHERE id = ?",
                     [password_hash, admin_name, existing_admin['id']]
@@ -364,14 +769,20 @@ async def _sync_admin_account(adapter: DatabaseAdapter, config: Dict[str, Any] =
             else:
                 logger.info(f"✅ 管理员账号配置正确: {admin_username}")
         else:
-            await adapter.execute(
-                """
-                INSERT INTO users (username, password_hash, name, auth_type, is_admin, is_active)
-                VALUES (?, ?, ?, 'local', 1, 1)
-                """,
-                [admin_username, password_hash, admin_name]
-            )
-            logger.info(f"✅ 管理员账号创建成功: {admin_username} / {admin_password}")
+            password_hash = PasswordUtil.hash_password(admin_password)
+            # 多个worker可能同时同步，用户名冲突时说明其他worker已创建
+            created = await adapter.table_insert_ignore('users', {
+                'username': admin_username,
+                'password_hash': password_hash,
+                'name': admin_name,
+                'auth_type': 'local',
+                'is_admin': 1,
+                'is_active': 1,
+            })
+            if created:
+                logger.info(f"✅ 管理员账号创建成功: {admin_username} / {admin_password}")
+            else:
+                logger.info(f"✅ 管理员账号已由其他worker创建: {admin_username}")
     except Exception as exc:
         logger.error(f'❌ 同步管理员账号失败: {exc}')
         raise
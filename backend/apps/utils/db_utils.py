@@ -37,9 +37,10 @@ class DB:
                     'user': app.config.get('DB_USER'),
                     'password': app.config.get('DB_PASS'),
                     'port': app.config.get('DB_PORT', 3306),
-                    'minsize': 3,
-                    'maxsize': 10,
-                    'pool_recycle': 3600
+                    'pool_size': 20,
+                    'max_overflow': 30,
+                    'pool_recycle': 1800,
+                    'pool_timeout': 30
                 }
                 logger.info(f"🔗 MySQL数据库: {config['host']}/{config['database']}")
                 
@@ -55,6 +56,34 @@ class DB:
             
             logger.info(f"✅ 数据库初始化成功: {db_type}")
         
+        @app.middleware('request')
+        async def open_db_scope(request):
+            """请求开始时创建请求级连接作用域（首次查询时才真正获取连接）"""
+            if hasattr(app.ctx, 'db'):
+                scope = app.ctx.db.begin_request_scope()
+                request.ctx.db_scope = scope
+                # 客户端断开时处理任务被取消，响应中间件不会执行，由连接结束信号兜底释放
+                if request.conn_info is not None:
+                    request.conn_info.ctx.db_scope = scope
+        
+        @app.middleware('response')
+        async def close_db_scope(request, response):
+            """请求结束时释放请求级连接"""
+            scope = getattr(request.ctx, 'db_scope', None)
+            if scope is not None:
+                request.ctx.db_scope = None
+                if request.conn_info is not None:
+                    request.conn_info.ctx.db_scope = None
+                await app.ctx.db.end_request_scope(scope)
+        
+        @app.signal('http.lifecycle.complete')
+        async def release_db_scope(conn_info):
+            """连接结束时释放未经响应中间件释放的请求级连接（如请求被取消）"""
+            scope = getattr(conn_info.ctx, 'db_scope', None)
+            if scope is not None:
+                conn_info.ctx.db_scope = None
+                await app.ctx.db.end_request_scope(scope)
+        
         @app.listener('after_server_stop')
         async def close_db(app, loop):
             """
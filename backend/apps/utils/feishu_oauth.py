@@ -6,10 +6,23 @@
 """
 
 import time
-import requests
+import hashlib
+import random
+import secrets
+import asyncio
+import httpx
+import orjson
+from urllib.parse import urlencode, quote
+from aiolimiter import AsyncLimiter
+from cachetools import TTLCache
 from sanic.log import logger
 from config.settings import Config
 
+try:
+    from redis import asyncio as aioredis
+except ImportError:
+    aioredis = None
+
 
 class FeishuOAuth:
     """飞书 OAuth2.0 认证工具"""
@@ -17,27 +30,167 @@ class FeishuOAuth:
     AUTH_URL = 'https://accounts.feishu.cn/open-apis/authen/v1/authorize'
     TENANT_TOKEN_URL = 'https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal'
     ACCESS_TOKEN_URL = 'https://open.feishu.cn/open-apis/authen/v1/access_token'
-    USER_INFO_URL_TEMPLATE = 'https://open.feishu.cn/open-apis/contact/v3/users/{open_id}?user_id_type=open_id'
+    USER_INFO_URL = 'https://open.feishu.cn/open-apis/contact/v3/users/'
     DEFAULT_SCOPE = 'contact:contact.base:readonly'
     
+    # 飞书频率限制错误码与重试参数
+    RATE_LIMIT_CODES = frozenset({99991400})
+    MAX_ATTEMPTS = 3
+    BACKOFF_BASE = 0.5
+    BACKOFF_CAP = 4.0
+    
+    # 进程内出站请求令牌桶，限制访问飞书的QPS
+    _limiter = AsyncLimiter(50, 1)
+    
+    # 用户信息中直接透传的字段：标识类字段缺失时为None，资料类字段缺失时为空串
+    _PROFILE_ID_FIELDS = ('open_id', 'union_id', 'user_id', 'tenant_key')
+    _PROFILE_TEXT_FIELDS = ('email', 'mobile', 'enterprise_email')
+    _AVATAR_FIELDS = ('avatar_72', 'avatar_240', 'avatar_640')
+    
+    # 用户信息短期缓存（open_id -> profile），TTL 较短以便头像等资料变更尽快生效
+    _profile_cache = TTLCache(maxsize=10000, ttl=60)
+    
+    # 授权码只能使用一次：按授权码指纹短暂缓存登录结果，仅供前端重复提交同一授权码时返回一次；
+    # 缓存中不保存用户的 access_token/refresh_token
+    _code_cache = TTLCache(maxsize=10000, ttl=10)
+    _USER_TOKEN_FIELDS = ('access_token', 'refresh_token', 'expires_in', 'token_type', 'scope')
+    
+    # 进程内共享的异步HTTP客户端，由 init_app 注册的监听器创建和关闭
+    _client = None
+    
+    # 获取tenant_access_token的请求体在进程内不变，首次使用时编码一次
+    _tenant_token_body = None
+    
+    # 进程级 tenant_access_token 缓存，所有实例共享；刷新由锁串行化，避免并发登录时重复请求
+    _token_cache = {'token': None, 'exp': 0}
+    _refresh_lock = asyncio.Lock()
+    
+    # 跨worker共享的Redis客户端（FEISHU_TOKEN_REDIS_ENABLED 开启时创建）
+    _redis = None
+    SHARED_TOKEN_KEY = 'feishu:tenant_token:{app_id}'
+    SHARED_LOCK_KEY = 'feishu:tenant_token_lock:{app_id}'
+    SHARED_LOCK_TTL = 5
+    # 仅当锁值仍为自己写入的随机令牌时才删除，避免锁过期后误删其他worker持有的锁
+    RELEASE_LOCK_SCRIPT = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('del', KEYS[1])
+        end
+        return 0
+    """
+    
+    # 后台刷新：在token过期前5分钟刷新，各worker随机错开±30秒；失败后1分钟重试
+    REFRESH_AHEAD = 300
+    REFRESH_JITTER = 30
+    REFRESH_RETRY_DELAY = 60
+    
+    @classmethod
+    def init_app(cls, app):
+        """注册异步HTTP客户端的生命周期监听器"""
+        @app.listener('before_server_start')
+        async def setup_feishu_client(app, loop):
+            cls._client = cls._create_client()
+            app.ctx.feishu_session = cls._client
+            
+            if getattr(Config, 'FEISHU_TOKEN_REDIS_ENABLED', False):
+                if aioredis is None:
+                    logger.warning('⚠️  未安装可用的异步Redis客户端，飞书 tenant_access_token 仅在进程内缓存')
+                else:
+                    cls._redis = aioredis.from_url(Config.REDIS_CON, decode_responses=True)
+            
+            if cls.is_configured():
+                app.add_task(cls._refresh_tenant_token_periodically(), name='feishu_tenant_token_refresh')
+        
+        @app.listener('after_server_stop')
+        async def close_feishu_client(app, loop):
+            if cls._client is not None:
+                await cls._client.aclose()
+                cls._client = None
+            if cls._redis is not None:
+                await cls._redis.aclose()
+                cls._redis = None
+    
+    @classmethod
+    async def _refresh_tenant_token_periodically(cls):
+        """启动时预取tenant_access_token，此后在过期前后台刷新，保证登录请求总能命中缓存"""
+        oauth = cls()
+        stale_token = None
+        while True:
+            try:
+                # 首轮为预取；之后把当前token视为过期，若其他worker已刷新到Redis则直接复用新token
+                stale_token = await oauth._get_tenant_access_token(stale_token=stale_token)
+                delay = cls._token_cache['exp'] - time.monotonic() - cls.REFRESH_AHEAD
+                delay += random.uniform(-cls.REFRESH_JITTER, cls.REFRESH_JITTER)
+                delay = max(delay, cls.REFRESH_JITTER)
+            except Exception as exc:
+                # 后台任务不能因单次失败退出，登录请求仍会按需获取token
+                logger.error('❌ 后台刷新飞书 tenant_access_token 失败: %s', exc)
+                delay = cls.REFRESH_RETRY_DELAY
+            await asyncio.sleep(delay)
+    
+    @staticmethod
+    def _create_client():
+        """
+        创建连接池化的客户端：启用HTTP/2，换码与查询用户信息复用同一条到 open.feishu.cn 的连接，
+        建连失败自动重试
+        """
+        # 自定义 transport 时客户端的 http2/limits 参数不生效，需在 transport 上配置
+        transport = httpx.AsyncHTTPTransport(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+            retries=3
+        )
+        # 建连超时单独收紧，网络异常时尽快失败；读写仍容忍较慢的响应
+        return httpx.AsyncClient(timeout=httpx.Timeout(8.0, connect=2.0), transport=transport)
+    
+    @classmethod
+    def _get_client(cls):
+        """获取共享客户端（未通过 init_app 初始化时按需创建）"""
+        if cls._client is None:
+            cls._client = cls._create_client()
+        return cls._client
+    
     def __init__(self):
         self.app_id = Config.FEISHU_APP_ID
         self.app_secret = Config.FEISHU_APP_SECRET
         self.redirect_uri = Config.FEISHU_REDIRECT_URI
-        self._tenant_access_token = None
-        self._tenant_token_expire_at = 0
+        self._configured = bool(self.app_id and self.app_secret and self.redirect_uri)
         
-        if not self.is_configured():
+        if not self._configured:
             logger.warning('⚠️  飞书 OAuth 未完整配置，登录将不可用')
     
+    async def _request(self, method, url, **kwargs):
+        """
+        发送飞书API请求并返回解析后的JSON
+        遇到HTTP 429或飞书频率限制错误码时按指数退避重试
+        """
+        if 'json' in kwargs:
+            # 请求体使用 orjson 编码，只在重试前编码一次
+            kwargs['content'] = orjson.dumps(kwargs.pop('json'))
+            kwargs['headers'] = {**kwargs.get('headers', {}), 'Content-Type': 'application/json'}
+        
+        client = self._get_client()
+        for attempt in range(self.MAX_ATTEMPTS):
+            async with self._limiter:
+                response = await client.request(method, url, **kwargs)
+            
+            rate_limited = response.status_code == 429
+            if not rate_limited:
+                response.raise_for_status()
+                data = orjson.loads(response.content)
+                rate_limited = data.get('code') in self.RATE_LIMIT_CODES
+                if not rate_limited or attempt == self.MAX_ATTEMPTS - 1:
+                    return data
+            elif attempt == self.MAX_ATTEMPTS - 1:
+                response.raise_for_status()
+            
+            delay = min(self.BACKOFF_BASE * 2 ** attempt, self.BACKOFF_CAP) + random.random() * 0.1
+            logger.warning('⚠️  飞书接口触发频率限制，%.2f秒后重试: %s', delay, url)
+            await asyncio.sleep(delay)
+    
     @staticmethod
     def is_configured():
         """检查飞书 OAuth 是否配置"""
-        return all([
-            getattr(Config, 'FEISHU_APP_ID', ''),
-            getattr(Config, 'FEISHU_APP_SECRET', ''),
-            getattr(Config, 'FEISHU_REDIRECT_URI', '')
-        ])
+        return bool(Config.FEISHU_APP_ID and Config.FEISHU_APP_SECRET and Config.FEISHU_REDIRECT_URI)
     
     def get_authorization_url(self, state=None, redirect_uri=None, scope=None):
         """
@@ -47,7 +200,7 @@ class FeishuOAuth:
             redirect_uri: 回调地址（默认读取配置）
             scope: 授权范围
         """
-        if not self.is_configured():
+        if not self._configured:
             raise ValueError('飞书 OAuth 未配置')
         
         params = {
@@ -59,49 +212,131 @@ class FeishuOAuth:
         if state:
             params['state'] = state
         
-        query = '&'.join(f'{k}={requests.utils.quote(str(v), safe="")}' for k, v in params.items() if v)
+        query = urlencode({k: v for k, v in params.items() if v}, quote_via=quote)
         return f'{self.AUTH_URL}?{query}'
     
-    def _get_tenant_access_token(self, force_refresh=False):
-        """获取（或复用）tenant_access_token"""
-        if not self.is_configured():
+    async def _get_tenant_access_token(self, stale_token=None):
+        """
+        获取（或复用）tenant_access_token
+        Args:
+            stale_token: 视为已过期的token（后台刷新时传入当前token），缓存中的同值token不再复用
+        """
+        if not self._configured:
             raise ValueError('飞书 OAuth 未配置')
         
-        now = time.time()
-        if not force_refresh and self._tenant_access_token and now < self._tenant_token_expire_at:
-            return self._tenant_access_token
+        cache = FeishuOAuth._token_cache
+        if self._is_usable(cache['token'], stale_token) and time.monotonic() < cache['exp']:
+            return cache['token']
         
-        payload = {
-            'app_id': self.app_id,
-            'app_secret': self.app_secret
-        }
+        async with FeishuOAuth._refresh_lock:
+            # 双重检查：等锁期间其他协程可能已完成刷新
+            if self._is_usable(cache['token'], stale_token) and time.monotonic() < cache['exp']:
+                return cache['token']
+            if FeishuOAuth._redis is None:
+                return await self._fetch_tenant_access_token()
+            try:
+                return await self._get_shared_tenant_access_token(stale_token)
+            except Exception as exc:
+                # Redis 不可用时退化为进程内缓存
+                logger.warning('⚠️  读取共享 tenant_access_token 失败，直接请求飞书: %s', exc)
+                return await self._fetch_tenant_access_token()
+    
+    @staticmethod
+    def _is_usable(token, stale_token):
+        """token存在且不是调用方要求刷新掉的旧token"""
+        return bool(token) and token != stale_token
+    
+    async def _get_shared_tenant_access_token(self, stale_token=None):
+        """通过Redis在多个worker间共享tenant_access_token，同一时刻只有一个worker请求飞书"""
+        redis = FeishuOAuth._redis
+        token_key = self.SHARED_TOKEN_KEY.format(app_id=self.app_id)
+        lock_key = self.SHARED_LOCK_KEY.format(app_id=self.app_id)
+        
+        token = await self._load_shared_token(redis, token_key, stale_token)
+        if token:
+            return token
+        
+        # SETNX 加锁，TTL 保证持锁worker异常退出后锁也会释放；锁值为随机令牌用于识别持有者
+        lock_token = secrets.token_hex(16)
+        deadline = time.monotonic() + self.SHARED_LOCK_TTL
+        while True:
+            acquired = await redis.set(lock_key, lock_token, nx=True, ex=self.SHARED_LOCK_TTL)
+            if acquired or time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(0.1)
+            token = await self._load_shared_token(redis, token_key, stale_token)
+            if token:
+                return token
+        
+        try:
+            if acquired:
+                # 加锁前其他worker可能刚完成刷新
+                token = await self._load_shared_token(redis, token_key, stale_token)
+                if token:
+                    return token
+            token = await self._fetch_tenant_access_token()
+            ttl = int(FeishuOAuth._token_cache['exp'] - time.monotonic())
+            if ttl > 0:
+                await redis.set(token_key, token, ex=ttl)
+            return token
+        finally:
+            # 等锁超时后未持锁也会直接请求飞书，此时不能释放锁
+            if acquired:
+                await redis.eval(self.RELEASE_LOCK_SCRIPT, 1, lock_key, lock_token)
+    
+    @classmethod
+    async def _load_shared_token(cls, redis, token_key, stale_token=None):
+        """读取Redis中的token，并按剩余TTL写入进程级缓存"""
+        token = await redis.get(token_key)
+        if not cls._is_usable(token, stale_token):
+            return None
+        ttl = await redis.ttl(token_key)
+        if ttl <= 0:
+            return None
+        FeishuOAuth._token_cache.update(token=token, exp=time.monotonic() + ttl)
+        return token
+    
+    @classmethod
+    def _get_tenant_token_body(cls):
+        """获取预编码的tenant_access_token请求体"""
+        if cls._tenant_token_body is None:
+            cls._tenant_token_body = orjson.dumps({
+                'app_id': Config.FEISHU_APP_ID,
+                'app_secret': Config.FEISHU_APP_SECRET
+            })
+        return cls._tenant_token_body
+    
+    async def _fetch_tenant_access_token(self):
+        """请求飞书获取新的tenant_access_token并写入进程级缓存"""
+        now = time.monotonic()
         
         try:
-            response = requests.post(
+            data = await self._request(
+                'POST',
                 self.TENANT_TOKEN_URL,
-                json=payload,
-                timeout=10
+                content=self._get_tenant_token_body(),
+                headers={'Content-Type': 'application/json'}
             )
-            response.raise_for_status()
-            data = response.json()
             
             if data.get('code') != 0:
                 raise ValueError(data.get('msg', 'tenant_access_token获取失败'))
             
             token = data.get('tenant_access_token')
             expire = data.get('expire', 3600)
-            self._tenant_access_token = token
-            self._tenant_token_expire_at = now + expire - 30  # 提前30秒刷新
+            FeishuOAuth._token_cache.update(
+                token=token,
+                exp=now + expire - 30  # 提前30秒刷新
+            )
             
             logger.info('✅ 成功获取飞书 tenant_access_token')
             return token
-        except Exception as exc:
-            logger.error(f'❌ 获取飞书 tenant_access_token 失败: {exc}')
+        except (httpx.HTTPError, ValueError, KeyError) as exc:
+            logger.error('❌ 获取飞书 tenant_access_token 失败: %s', exc)
             raise
     
-    def _exchange_code(self, code):
+    async def _exchange_code(self, code, tenant_token=None):
         """通过授权码获取用户access_token和open_id"""
-        tenant_token = self._get_tenant_access_token()
+        tenant_token = tenant_token or await self._get_tenant_access_token()
         headers = {
             'Authorization': f'Bearer {tenant_token}',
             'Content-Type': 'application/json'
@@ -112,35 +347,30 @@ class FeishuOAuth:
         }
         
         try:
-            response = requests.post(
-                self.ACCESS_TOKEN_URL,
-                json=payload,
-                headers=headers,
-                timeout=10
-            )
-            response.raise_for_status()
-            data = response.json()
+            data = await self._request('POST', self.ACCESS_TOKEN_URL, json=payload, headers=headers)
             if data.get('code') != 0:
                 raise ValueError(data.get('msg', '获取用户access_token失败'))
             
             return data.get('data', {})
-        except Exception as exc:
-            logger.error(f'❌ 交换飞书授权码失败: {exc}')
+        except (httpx.HTTPError, ValueError, KeyError) as exc:
+            logger.error('❌ 交换飞书授权码失败: %s', exc)
             raise
     
-    def _get_user_profile(self, open_id):
+    async def _get_user_profile(self, open_id, tenant_token=None):
         """使用tenant_access_token获取用户信息"""
-        tenant_token = self._get_tenant_access_token()
+        cached = self._profile_cache.get(open_id)
+        if cached is not None:
+            return dict(cached)
+        
+        tenant_token = tenant_token or await self._get_tenant_access_token()
         headers = {
             'Authorization': f'Bearer {tenant_token}',
             'Content-Type': 'application/json'
         }
-        url = self.USER_INFO_URL_TEMPLATE.format(open_id=open_id)
+        url = f'{self.USER_INFO_URL}{quote(open_id, safe="")}?user_id_type=open_id'
         
         try:
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = await self._request('GET', url, headers=headers)
             
             if data.get('code') != 0:
                 raise ValueError(data.get('msg', '获取用户信息失败'))
@@ -148,34 +378,36 @@ class FeishuOAuth:
             user = data.get('data', {}).get('user', {})
             avatar = user.get('avatar', {}) or {}
             
-            return {
-                'open_id': user.get('open_id'),
-                'union_id': user.get('union_id'),
-                'name': user.get('name') or user.get('en_name') or '',
-                'avatar_72': avatar.get('avatar_72', ''),
-                'avatar_240': avatar.get('avatar_240', ''),
-                'avatar_640': avatar.get('avatar_640', ''),
-                'email': user.get('email', ''),
-                'mobile': user.get('mobile', ''),
-                'enterprise_email': user.get('enterprise_email', ''),
-                'user_id': user.get('user_id'),
-                'tenant_key': user.get('tenant_key'),
-            }
-        except Exception as exc:
-            logger.error(f'❌ 获取飞书用户信息失败: {exc}')
+            profile = {k: user.get(k) for k in self._PROFILE_ID_FIELDS}
+            profile.update({k: user.get(k, '') for k in self._PROFILE_TEXT_FIELDS})
+            profile.update({k: avatar.get(k, '') for k in self._AVATAR_FIELDS})
+            profile['name'] = user.get('name') or user.get('en_name') or ''
+            # 调用方会在返回值上追加登录凭证，缓存中只保存副本
+            self._profile_cache[open_id] = dict(profile)
+            return profile
+        except (httpx.HTTPError, ValueError, KeyError) as exc:
+            logger.error('❌ 获取飞书用户信息失败: %s', exc)
             raise
     
-    def get_user_by_code(self, code):
+    async def get_user_by_code(self, code):
         """通过授权码获取完整的飞书用户信息"""
         if not code:
             raise ValueError('缺少授权码')
         
-        access_data = self._exchange_code(code)
+        # 只保存授权码的哈希，避免原始授权码驻留内存
+        code_key = hashlib.sha256(code.encode()).hexdigest()
+        cached = self._code_cache.pop(code_key, None)
+        if cached is not None:
+            return cached
+        
+        # tenant_access_token 只取一次，供换码和查询用户信息两个请求复用
+        tenant_token = await self._get_tenant_access_token()
+        access_data = await self._exchange_code(code, tenant_token)
         open_id = access_data.get('open_id')
         if not open_id:
             raise ValueError('飞书返回数据缺少open_id')
         
-        profile = self._get_user_profile(open_id)
+        profile = await self._get_user_profile(open_id, tenant_token)
         profile.update({
             'access_token': access_data.get('access_token'),
             'refresh_token': access_data.get('refresh_token'),
@@ -184,4 +416,7 @@ class FeishuOAuth:
             'scope': access_data.get('scope'),
             'tenant_key': access_data.get('tenant_key') or profile.get('tenant_key')
         })
+        self._code_cache[code_key] = {
+            k: v for k, v in profile.items() if k not in self._USER_TOKEN_FIELDS
+        }
         return profile
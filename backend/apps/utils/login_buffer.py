@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+最后登录时间写缓冲
+登录时只记录到内存，由后台任务定期批量写回数据库
+"""
+
+import asyncio
+from typing import Callable, Optional, Set
+
+from sanic.log import logger
+
+
+class LastLoginBuffer:
+    """最后登录时间批量写回缓冲区"""
+
+    # 登录时间由数据库在写回时生成，误差不超过一个刷新间隔
+    FLUSH_SQL = "UPDATE users SET last_login_time = CURRENT_TIMESTAMP WHERE id = ?"
+
+    def __init__(self, adapter, interval: float = 5.0, max_pending: int = 500):
+        """
+        Args:
+            adapter: 数据库适配器
+            interval: 定时刷新间隔（秒）
+            max_pending: 待写条数达到该值时立即刷新
+        """
+        self.adapter = adapter
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending: Set[int] = set()
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_listeners: Set[Callable[[int], None]] = set()
+
+    def record(self, user_id: int):
+        """记录一次登录（非阻塞，同一用户在一个刷新周期内只写一次）"""
+        self._pending.add(int(user_id))
+        if len(self._pending) >= self.max_pending:
+            self._wakeup.set()
+
+    def add_flush_listener(self, callback: Callable[[int], None]):
+        """注册写回成功后的回调（按用户ID调用，用于清理依赖登录时间的缓存）"""
+        self._flush_listeners.add(callback)
+
+    def start(self):
+        """启动后台刷新任务"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并写回剩余数据"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        """将缓冲区中的登录时间一次性批量写回"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            # 在同一事件循环内直接交换集合，record() 无需加锁
+            pending, self._pending = self._pending, set()
+            rows = [(user_id,) for user_id in pending]
+            try:
+                await self.adapter.execute_many(self.FLUSH_SQL, rows)
+            except Exception as exc:
+                # 写回失败时放回缓冲区，等待下次刷新
+                self._pending.update(pending)
+                logger.error(f'❌ 批量更新登录时间失败: {exc}')
+                return
+            # 写回前读到的旧登录时间可能已被缓存，写回后再清理一次
+            for callback in self._flush_listeners:
+                for user_id in pending:
+                    callback(user_id)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
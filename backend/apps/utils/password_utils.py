@@ -5,13 +5,26 @@
 用于本地用户名密码认证
 """
 
+import hmac
+import random
+import string
+
 import bcrypt
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from sanic.log import logger
 
 
+# bcrypt 旧哈希前缀（$2a$/$2b$/$2y$），验证通过后迁移为 Argon2id
+BCRYPT_HASH_PREFIXES = ('$2a$', '$2b$', '$2y$')
+
+
 class PasswordUtil:
     """密码哈希和验证工具"""
     
+    # Argon2id 参数: t=2, m=19MiB, p=1（OWASP 推荐的交互式登录参数）
+    _hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+    
     @staticmethod
     def hash_password(password):
         """
@@ -25,18 +38,13 @@ class PasswordUtil:
             
         Example:
             >>> hashed = PasswordUtil.hash_password('admin123')
-            >>> # hashed: $2b$12$...
+            >>> # hashed: $argon2id$v=19$m=19456,t=2,p=1$...
         """
         if not password:
             raise ValueError('密码不能为空')
         
-        # 使用bcrypt进行加密（自动生成salt）
-        password_bytes = password.encode('utf-8')
-        salt = bcrypt.gensalt(rounds=12)  # 12轮加密（平衡安全性和性能）
-        hashed = bcrypt.hashpw(password_bytes, salt)
-        
-        # 返回字符串格式
-        return hashed.decode('utf-8')
+        # 使用Argon2id进行加密（自动生成salt）
+        return PasswordUtil._hasher.hash(password)
     
     @staticmethod
     def verify_password(password, password_hash):
@@ -59,16 +67,62 @@ class PasswordUtil:
             return False
         
         try:
-            password_bytes = password.encode('utf-8')
-            hash_bytes = password_hash.encode('utf-8')
+            # 兼容旧的bcrypt哈希
+            if password_hash.startswith(BCRYPT_HASH_PREFIXES):
+                return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
             
-            # 使用bcrypt验证
-            return bcrypt.checkpw(password_bytes, hash_bytes)
+            # 使用Argon2id验证
+            return PasswordUtil._hasher.verify(password_hash, password)
             
+        except (VerificationError, InvalidHashError):
+            return False
         except Exception as e:
             logger.error(f'❌ 密码验证失败: {e}')
             return False
     
+    @staticmethod
+    def constant_time_equal(a, b):
+        """
+        常量时间比较，避免逐字节比较带来的时序侧信道
+        
+        bcrypt/Argon2 的校验函数本身已是常量时间，
+        自定义的哈希、令牌等相等性判断应统一使用本方法
+        
+        Args:
+            a: str 或 bytes
+            b: str 或 bytes
+            
+        Returns:
+            bool: 是否相等
+        """
+        if a is None or b is None:
+            return False
+        if isinstance(a, str):
+            a = a.encode('utf-8')
+        if isinstance(b, str):
+            b = b.encode('utf-8')
+        return hmac.compare_digest(a, b)
+    
+    @staticmethod
+    def needs_rehash(password_hash):
+        """
+        判断密码哈希是否需要重新计算
+        
+        Args:
+            password_hash: 存储的密码哈希
+            
+        Returns:
+            bool: 旧的bcrypt哈希或Argon2参数已变更时返回True
+        """
+        if not password_hash:
+            return False
+        if password_hash.startswith(BCRYPT_HASH_PREFIXES):
+            return True
+        try:
+            return PasswordUtil._hasher.check_needs_rehash(password_hash)
+        except InvalidHashError:
+            return True
+    
     @staticmethod
     def validate_password_strength(password):
         """
@@ -117,9 +171,6 @@ class PasswordUtil:
         Returns:
             str: 随机密码
         """
-        import random
-        import string
-        
         # 确保密码包含大小写字母、数字
         chars = string.ascii_letters + string.digits
         
@@ -17,6 +17,8 @@ class BaseConfig(object):
     FEISHU_APP_ID = ''
     FEISHU_APP_SECRET = ''
     FEISHU_REDIRECT_URI = ''
+    # 多worker部署时通过Redis共享tenant_access_token（使用 REDIS_CON 连接）
+    FEISHU_TOKEN_REDIS_ENABLED = False
     
     # ==========================================
     # 数据库配置
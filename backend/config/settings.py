@@ -27,6 +27,14 @@ class Config(BaseConfig):
     FEISHU_APP_ID = os.getenv('FEISHU_APP_ID') or (cf.FEISHU_APP_ID if hasattr(cf, 'FEISHU_APP_ID') else '')
     FEISHU_APP_SECRET = os.getenv('FEISHU_APP_SECRET') or (cf.FEISHU_APP_SECRET if hasattr(cf, 'FEISHU_APP_SECRET') else '')
     FEISHU_REDIRECT_URI = os.getenv('FEISHU_REDIRECT_URI') or (cf.FEISHU_REDIRECT_URI if hasattr(cf, 'FEISHU_REDIRECT_URI') else '')
+    _feishu_token_redis_env = os.getenv('FEISHU_TOKEN_REDIS_ENABLED')
+    if _feishu_token_redis_env is not None:
+        FEISHU_TOKEN_REDIS_ENABLED = _feishu_token_redis_env.lower() in ('1', 'true', 'yes', 'on')
+    else:
+        FEISHU_TOKEN_REDIS_ENABLED = cf.FEISHU_TOKEN_REDIS_ENABLED if hasattr(cf, 'FEISHU_TOKEN_REDIS_ENABLED') else False
+    
+    # Redis配置（优先使用环境变量）
+    REDIS_CON = os.getenv('REDIS_CON') or (cf.REDIS_CON if hasattr(cf, 'REDIS_CON') else 'redis://127.0.0.1:6379/2')
     
     # 默认管理员账号配置（优先使用环境变量）
     DEFAULT_ADMIN_USERNAME = os.getenv('ADMIN_USERNAME') or (cf.DEFAULT_ADMIN_USERNAME if hasattr(cf, 'DEFAULT_ADMIN_USERNAME') else 'admin')
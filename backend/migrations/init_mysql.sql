@@ -41,6 +41,7 @@ CREATE TABLE `users` (
   UNIQUE KEY `uk_linux_do_id` (`linux_do_id`),
   UNIQUE KEY `uk_feishu_open_id` (`feishu_open_id`),
   UNIQUE KEY `uk_username` (`username`),
+  KEY `idx_email` (`email`),
   KEY `idx_auth_type` (`auth_type`),
   KEY `idx_is_active` (`is_active`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='用户表';
@@ -411,4 +412,15 @@ CREATE TABLE `prompt_visits` (
   CONSTRAINT `fk_visits_user_id` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='提示词访问足迹表';
 
+-- ----------------------------
+-- 系统元数据表（多worker启动任务协调等）
+-- ----------------------------
+DROP TABLE IF EXISTS `system_metadata`;
+CREATE TABLE `system_metadata` (
+  `meta_key` VARCHAR(64) NOT NULL,
+  `meta_value` VARCHAR(255) DEFAULT NULL,
+  `updated_at` BIGINT NOT NULL DEFAULT 0 COMMENT '最后更新时间（Unix时间戳）',
+  PRIMARY KEY (`meta_key`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='系统元数据表';
+
 SET FOREIGN_KEY_CHECKS = 1;
@@ -35,6 +35,7 @@ CREATE TABLE IF NOT EXISTS users (
 CREATE UNIQUE INDEX IF NOT EXISTS uk_linux_do_id ON users(linux_do_id);
 CREATE UNIQUE INDEX IF NOT EXISTS uk_feishu_open_id ON users(feishu_open_id);
 CREATE UNIQUE INDEX IF NOT EXISTS uk_username ON users(username);
+CREATE INDEX IF NOT EXISTS idx_email ON users(email);
 CREATE INDEX IF NOT EXISTS idx_auth_type ON users(auth_type);
 CREATE INDEX IF NOT EXISTS idx_is_active ON users(is_active);
 
@@ -416,3 +417,10 @@ CREATE INDEX IF NOT EXISTS idx_visits_prompt_id ON prompt_visits(prompt_id);
 CREATE INDEX IF NOT EXISTS idx_visits_user_id ON prompt_visits(user_id);
 CREATE INDEX IF NOT EXISTS idx_visits_time ON prompt_visits(visit_time DESC);
 CREATE UNIQUE INDEX IF NOT EXISTS uk_prompt_visit_user ON prompt_visits(prompt_id, user_id);
+
+-- 系统元数据表（多worker启动任务协调等）
+CREATE TABLE IF NOT EXISTS system_metadata (
+  meta_key VARCHAR(64) PRIMARY KEY,
+  meta_value VARCHAR(255) DEFAULT NULL,
+  updated_at BIGINT NOT NULL DEFAULT 0
+);